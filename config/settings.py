@@ -80,6 +80,16 @@ DATABASES = {
     )
 }
 
+# Cache (Redis on Render). Flash-sale stock counters need a cache shared by
+# all workers, so without REDIS_URL flash-sale products use the database.
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
     {"NAME": "django.contrib.auth.password_validation.MinimumLengthValidator"},
@@ -1,10 +1,29 @@
 from django.contrib import admin
+from django.db import transaction
 from .models import Category, Product
+from . import flash_sale
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ['name', 'price', 'category', 'is_available']
-    list_editable = ['price', 'is_available']
+    list_display = ['name', 'price', 'category', 'is_available', 'flash_sale']
+    list_editable = ['price', 'is_available', 'flash_sale']
+    list_filter = ['flash_sale']
+
+    def save_model(self, request, obj, form, change):
+        if obj.pk is None:
+            super().save_model(request, obj, form, change)
+        else:
+            if not obj.flash_sale and Product.objects.filter(pk=obj.pk, flash_sale=True).exists():
+                # Leaving flash-sale mode: applies what sold during the drop
+                flash_sale.close(obj)
+            with transaction.atomic():
+                current = Product.objects.select_for_update().get(pk=obj.pk)
+                if 'quantity' not in form.changed_data:
+                    # Don't overwrite sales made since the form was loaded
+                    obj.quantity = current.quantity
+                super().save_model(request, obj, form, change)
+        if obj.flash_sale and {'quantity', 'flash_sale'} & set(form.changed_data):
+            flash_sale.restock(obj)
 
 admin.site.register(Category)
 from .models import Review
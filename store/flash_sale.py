@@ -0,0 +1,286 @@
+"""
+Flash-sale stock counters.
+
+Products flagged with `flash_sale` sell from an atomic cache counter instead
+of locking the `quantity` row, so a drop doesn't queue every checkout on the
+same Postgres row. Every sale is also logged as a `FlashSaleReservation`
+(a plain insert, no shared row), and the `flush_flash_sales` command applies
+that log to `Product.quantity` (write-behind).
+
+The database is always the truth: a counter is only ever (re)built as
+`quantity - pending reservations`, so losing the cache can't put sold units
+back on sale. Until the flusher rebuilds a lost counter the product simply
+reads as sold out. Redis should still run with persistence and
+`maxmemory-policy noeviction` so that doesn't happen mid-drop.
+
+A sale is logged before it's taken from the counter. An admin restock that
+lands between the two counts that sale twice, so restocking during a live
+drop can undersell by the orders in flight at that moment, until the next
+restock.
+
+Flash-sale mode only turns on with the Redis cache backend: the counters
+need atomic scripts shared by every worker.
+"""
+import logging
+import threading
+from collections import namedtuple
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import FlashSaleReservation, Product
+
+KEY_PREFIX = "flash_sale:stock:"
+ACTIVE_KEY = "flash_sale:active"
+
+# Returned by _take() / _give() instead of the new stock
+MISSING = -1
+SHORT = -2
+
+# Decrement-if-enough, in one step so no one ever sees a negative counter
+TAKE_SCRIPT = """
+local stock = tonumber(redis.call('get', KEYS[1]))
+if stock == nil then return -1 end
+if stock < tonumber(ARGV[1]) then return -2 end
+return redis.call('decrby', KEYS[1], ARGV[1])
+"""
+
+# Increment only if the counter still exists, so a deleted counter stays deleted
+GIVE_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 0 then return -1 end
+return redis.call('incrby', KEYS[1], ARGV[1])
+"""
+
+logger = logging.getLogger(__name__)
+
+# Stands in for the scripts on LocMem, which only the tests use
+_local_lock = threading.Lock()
+
+# What take_stock() holds; `reservation` is None for the database path
+Hold = namedtuple("Hold", ["product", "qty", "reservation"])
+
+
+def _cache():
+    return caches["default"]
+
+
+def _key(pk):
+    return f"{KEY_PREFIX}{pk}"
+
+
+def cache_is_shared():
+    # Only Redis: other backends have no atomic decrement-if-enough shared by
+    # every gunicorn worker
+    return isinstance(_cache(), RedisCache)
+
+
+def is_active(product):
+    return product.flash_sale and cache_is_shared()
+
+
+def _run_script(script, key, qty):
+    cache = _cache()
+    full_key = cache.make_and_validate_key(key)
+    client = cache._cache.get_client(full_key, write=True)
+    return client.eval(script, 1, full_key, qty)
+
+
+def _local_cache():
+    if not isinstance(_cache(), LocMemCache):
+        raise ImproperlyConfigured("Flash sales need the Redis cache backend.")
+    return _cache()
+
+
+def _take(key, qty):
+    if isinstance(_cache(), RedisCache):
+        return _run_script(TAKE_SCRIPT, key, qty)
+    _local_cache()
+    with _local_lock:
+        stock = _cache().get(key)
+        if stock is None:
+            return MISSING
+        if stock < qty:
+            return SHORT
+        _cache().set(key, stock - qty, timeout=None)
+        return stock - qty
+
+
+def _give(key, qty):
+    if isinstance(_cache(), RedisCache):
+        return _run_script(GIVE_SCRIPT, key, qty)
+    _local_cache()
+    with _local_lock:
+        stock = _cache().get(key)
+        if stock is None:
+            return MISSING
+        _cache().set(key, stock + qty, timeout=None)
+        return stock + qty
+
+
+def _pending(pk):
+    total = FlashSaleReservation.objects.filter(product_id=pk).aggregate(total=Sum("quantity"))["total"]
+    return total or 0
+
+
+def _rebuild(pk, overwrite):
+    with transaction.atomic():
+        product = Product.objects.select_for_update().filter(pk=pk, flash_sale=True).first()
+        # Never build a counter for a product that has left flash-sale mode
+        if product is None:
+            return
+        stock = max(product.quantity - _pending(pk), 0)
+        if overwrite:
+            _cache().set(_key(pk), stock, timeout=None)
+        else:
+            _cache().add(_key(pk), stock, timeout=None)
+
+
+def seed(product):
+    # Only sets the counter if it's missing, so live stock is never overwritten
+    _rebuild(product.pk, overwrite=False)
+
+
+def restock(product):
+    # Overwrites the counter; see the module docstring about live drops
+    _rebuild(product.pk, overwrite=True)
+
+
+def close(product):
+    """
+    Takes a product out of flash-sale mode. The flag is cleared first so new
+    checkouts go back to the database, then the counter is dropped and the
+    sales made during the drop are applied to `quantity`.
+    """
+    Product.objects.filter(pk=product.pk).update(flash_sale=False)
+    _cache().delete(_key(product.pk))
+    flush_product(product.pk)
+    product.flash_sale = False
+
+
+def available(product):
+    if not is_active(product):
+        return product.quantity
+    # A missing counter, or a cache outage, reads as sold out
+    try:
+        return _cache().get(_key(product.pk), 0)
+    except Exception:
+        logger.exception("Flash-sale counter unavailable for product %s", product.pk)
+        return 0
+
+
+def live_stock(products):
+    """
+    Returns the products as a list, with `quantity` of flash-sale products
+    replaced by their counter so templates keep using `product.quantity`.
+    Don't save() these instances.
+    """
+    products = list(products)
+    flagged = [p for p in products if is_active(p)]
+    if not flagged:
+        return products
+
+    try:
+        counters = _cache().get_many([_key(p.pk) for p in flagged])
+    except Exception:
+        # Browsing must survive a cache outage: show flash-sale items as sold out
+        logger.exception("Flash-sale counters unavailable")
+        counters = {}
+    for product in flagged:
+        product.quantity = counters.get(_key(product.pk), 0)
+    return products
+
+
+def reserve(product, qty=1):
+    """
+    Takes `qty` from the counter and logs the sale. Returns the
+    reservation, or None if there isn't enough stock.
+    """
+    key = _key(product.pk)
+    # Cheap refusal once sold out, without touching the database
+    if _cache().get(key, 0) < qty:
+        return None
+
+    # Log first: a rebuilt counter then always counts this sale, so a lost
+    # cache can only undersell, never oversell
+    reservation = FlashSaleReservation.objects.create(product=product, quantity=qty)
+    if _take(key, qty) < 0:
+        _drop(reservation)
+        return None
+    return reservation
+
+
+def _drop(reservation):
+    deleted, _ = FlashSaleReservation.objects.filter(pk=reservation.pk).delete()
+    if not deleted:
+        # The flusher already applied it to the database
+        Product.objects.filter(pk=reservation.product_id).update(quantity=F("quantity") + reservation.quantity)
+
+
+def release(reservation):
+    _give(_key(reservation.product_id), reservation.quantity)
+    _drop(reservation)
+
+
+def take_stock(product, qty):
+    """
+    Takes stock for a checkout, from the counter for flash-sale products and
+    with a conditional update of the row otherwise. Returns a Hold to pass
+    to return_stock(), or None if there isn't enough stock.
+    """
+    if is_active(product):
+        reservation = reserve(product, qty)
+        return None if reservation is None else Hold(product, qty, reservation)
+
+    taken = Product.objects.filter(pk=product.pk, quantity__gte=qty).update(quantity=F("quantity") - qty)
+    return Hold(product, qty, None) if taken else None
+
+
+def return_stock(hold):
+    if hold.reservation is not None:
+        release(hold.reservation)
+    else:
+        Product.objects.filter(pk=hold.product.pk).update(quantity=F("quantity") + hold.qty)
+
+
+def flush_product(pk):
+    """Applies one product's logged sales to its `quantity`. Returns the units applied."""
+    with transaction.atomic():
+        rows = list(
+            FlashSaleReservation.objects.select_for_update()
+            .filter(product_id=pk)
+            .values_list("pk", "quantity")
+        )
+        if not rows:
+            return 0
+        sold = sum(qty for _, qty in rows)
+        FlashSaleReservation.objects.filter(pk__in=[row_pk for row_pk, _ in rows]).delete()
+        Product.objects.filter(pk=pk).update(quantity=F("quantity") - sold)
+    return sold
+
+
+def flush():
+    """
+    One write-behind pass: applies every logged sale to `Product.quantity`,
+    rebuilds counters lost with the cache and drops counters of products
+    that are no longer flagged. Returns how many products were updated.
+    Each product's log is applied in one transaction, so a crash mid-pass
+    is picked up by the next one.
+    """
+    cache = _cache()
+    pending = set(FlashSaleReservation.objects.values_list("product_id", flat=True).distinct())
+    written = sum(1 for pk in pending if flush_product(pk))
+
+    flagged = set(Product.objects.filter(flash_sale=True).values_list("pk", flat=True))
+    counters = cache.get_many([_key(pk) for pk in flagged])
+    for pk in flagged:
+        if _key(pk) not in counters:
+            _rebuild(pk, overwrite=False)
+
+    stale = set(cache.get(ACTIVE_KEY, [])) - flagged
+    cache.delete_many([_key(pk) for pk in stale])
+    cache.set(ACTIVE_KEY, sorted(flagged), timeout=None)
+    return written
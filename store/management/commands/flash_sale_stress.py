@@ -0,0 +1,143 @@
+import multiprocessing
+import time
+import uuid
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+# Store modules are imported inside functions: spawned workers import this
+# module before Django is set up.
+
+
+def _worker(pk, orders, barrier, results):
+    django.setup()
+    from store import flash_sale
+    from store.models import Product
+
+    product = Product.objects.get(pk=pk)
+    barrier.wait()
+
+    sold = 0
+    last_sale = None
+    for _ in range(orders):
+        # The same call checkout makes; the product's flag picks the path
+        if flash_sale.take_stock(product, 1) is not None:
+            sold += 1
+            last_sale = time.perf_counter()
+    results.put((sold, last_sale))
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammers one product from several processes, first through the "
+        "database and then through flash-sale counters, and checks for "
+        "oversell. Needs Postgres and REDIS_URL to be meaningful. Writes to "
+        "the configured database and cache, so it only runs with DEBUG on "
+        "or --yes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=8)
+        parser.add_argument("--orders", type=int, default=200, help="Checkouts per process.")
+        parser.add_argument(
+            "--stock",
+            type=int,
+            help="Default: one unit per checkout, so every attempt is a sale.",
+        )
+        parser.add_argument(
+            "--yes",
+            action="store_true",
+            help="Run even with DEBUG off (DATABASE_URL and REDIS_URL may be production).",
+        )
+
+    def handle(self, *args, **options):
+        from django.conf import settings
+        from django.db import connections
+        from store import flash_sale
+        from store.models import Category, Product
+
+        if not settings.DEBUG and not options["yes"]:
+            raise CommandError("DEBUG is off, so this may be production. Pass --yes to run anyway.")
+        if not flash_sale.cache_is_shared():
+            raise CommandError("Flash sales need the Redis cache. Set REDIS_URL.")
+
+        processes = options["processes"]
+        orders = options["orders"]
+        attempts = processes * orders
+        stock = options["stock"] or attempts
+        expected = min(stock, attempts)
+
+        run = uuid.uuid4().hex[:8]
+        category = Category.objects.create(name="Flash sale stress", slug=f"flash-sale-stress-{run}")
+        product = Product.objects.create(
+            category=category,
+            name="Flash sale stress",
+            price=1,
+            quantity=stock,
+            is_available=False,
+        )
+        try:
+            rates = {}
+            for mode in ("db", "flash"):
+                Product.objects.filter(pk=product.pk).update(quantity=stock, flash_sale=mode == "flash")
+                product.refresh_from_db()
+                if mode == "flash":
+                    flash_sale.restock(product)
+
+                connections.close_all()
+                sold, elapsed = self._run(product.pk, processes, orders)
+
+                if mode == "flash":
+                    # Only this product: never touch real counters
+                    flash_sale.close(product)
+                product.refresh_from_db()
+
+                # Sales over the time it took to make them, so refusals after
+                # selling out don't inflate either rate
+                rates[mode] = sold / elapsed if elapsed else 0
+                self.stdout.write(
+                    f"{mode:<5} sold {sold}/{stock} in {attempts} checkouts, "
+                    f"{elapsed:.2f}s to sell, {rates[mode]:.0f} orders/s"
+                )
+                if sold > stock or product.quantity != stock - sold:
+                    raise CommandError(
+                        f"{mode}: oversold (sold {sold} of {stock}, {product.quantity} left in the database)"
+                    )
+                if sold != expected:
+                    raise CommandError(f"{mode}: expected to sell {expected}, sold {sold}")
+        finally:
+            flash_sale.close(product)
+            category.delete()
+
+        speedup = rates["flash"] / rates["db"] if rates["db"] else 0
+        if speedup <= 1:
+            raise CommandError(f"No oversell, but flash sale was not faster than the database ({speedup:.2f}x).")
+        self.stdout.write(self.style.SUCCESS(
+            f"No oversell. Flash sale sold at {speedup:.1f}x the database rate."
+        ))
+
+    def _run(self, pk, processes, orders):
+        # Spawn (not fork) so workers don't share the parent's connections
+        ctx = multiprocessing.get_context("spawn")
+        barrier = ctx.Barrier(processes + 1, timeout=120)
+        results = ctx.Queue()
+        workers = [
+            ctx.Process(target=_worker, args=(pk, orders, barrier, results))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+
+        # Start the clock once every worker is set up and connected; stop it
+        # at the last sale (perf_counter is system-wide, so it compares
+        # across processes)
+        barrier.wait()
+        start = time.perf_counter()
+        outcomes = [results.get(timeout=600) for _ in workers]
+        sold = sum(worker_sold for worker_sold, _ in outcomes)
+        last_sales = [last_sale for _, last_sale in outcomes if last_sale is not None]
+        elapsed = max(last_sales) - start if last_sales else 0
+
+        for worker in workers:
+            worker.join()
+        return sold, elapsed
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store import flash_sale
+
+
+class Command(BaseCommand):
+    help = "Applies logged flash-sale sales to Product.quantity and rebuilds lost counters."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Keep flushing every N seconds (run as a worker). Default: flush once.",
+        )
+
+    def handle(self, *args, **options):
+        if not flash_sale.cache_is_shared():
+            raise CommandError("Flash sales need the Redis cache. Set REDIS_URL.")
+
+        interval = options["interval"]
+        while True:
+            # Every pass also recovers counters lost in a crash, so a
+            # restarted worker picks up where the last one stopped
+            written = flash_sale.flush()
+            self.stdout.write(f"Flushed {written} product(s).")
+            if interval <= 0:
+                return
+            time.sleep(interval)
@@ -0,0 +1,39 @@
+# Product.quantity was added to the model without a migration, so some
+# databases already have the column and fresh ones don't. Add it only
+# where it's missing.
+
+from django.db import migrations, models
+
+
+def add_quantity_if_missing(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    table = Product._meta.db_table
+    with schema_editor.connection.cursor() as cursor:
+        columns = schema_editor.connection.introspection.get_table_description(cursor, table)
+    if 'quantity' not in {column.name for column in columns}:
+        # The historical model doesn't have the field yet, so build it here
+        field = models.IntegerField(default=0)
+        field.set_attributes_from_name('quantity')
+        schema_editor.add_field(Product, field)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_alter_product_image'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='product',
+                    name='quantity',
+                    field=models.IntegerField(default=0),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(add_quantity_if_missing, migrations.RunPython.noop),
+            ],
+        ),
+    ]
@@ -27,6 +27,9 @@ class Product(models.Model):
 
     quantity = models.IntegerField(default=0)
 
+    # Flash sale: stock is held in a cache counter and flushed back to `quantity`
+    flash_sale = models.BooleanField(default=False)
+
     is_available = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -34,6 +37,20 @@ class Product(models.Model):
         return self.name
 
 
+class FlashSaleReservation(models.Model):
+    # Durable record of a flash-sale sale, applied to `Product.quantity` by the flusher
+    product = models.ForeignKey(
+        Product,
+        related_name="flash_sale_reservations",
+        on_delete=models.CASCADE
+    )
+    quantity = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.product} x{self.quantity}"
+
+
 class Review(models.Model):
     name = models.CharField(max_length=100)
     text = models.TextField()
@@ -1,3 +1,225 @@
-from django.test import TestCase
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.admin.sites import AdminSite
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from . import flash_sale
+from .admin import ProductAdmin
+from .models import Category, FlashSaleReservation, Product
+
+# Kept before setUp patches it, to test the real backend check
+cache_is_shared = flash_sale.cache_is_shared
+
+TEST_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "flash-sale-tests",
+    }
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FlashSaleTestCase(TestCase):
+    def setUp(self):
+        # LocMem stands in for Redis here; flash_sale falls back to a lock
+        patcher = mock.patch("store.flash_sale.cache_is_shared", return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        caches["default"].clear()
+
+        self.category = Category.objects.create(name="Rings", slug="rings")
+        self.product = Product.objects.create(
+            category=self.category, name="Ring", price=10, quantity=5, flash_sale=True
+        )
+        flash_sale.restock(self.product)
+
+    def counter(self):
+        return caches["default"].get(flash_sale._key(self.product.pk))
+
+    def quantity(self):
+        return Product.objects.get(pk=self.product.pk).quantity
+
+
+class ReserveTests(FlashSaleTestCase):
+    def test_reserve_takes_stock_and_logs_sale(self):
+        reservation = flash_sale.reserve(self.product, 2)
+
+        self.assertIsNotNone(reservation)
+        self.assertEqual(self.counter(), 3)
+        self.assertEqual(FlashSaleReservation.objects.get().quantity, 2)
+        self.assertEqual(self.quantity(), 5)
+
+    def test_reserve_refuses_without_enough_stock(self):
+        self.assertIsNone(flash_sale.reserve(self.product, 6))
+        self.assertEqual(self.counter(), 5)
+        self.assertFalse(FlashSaleReservation.objects.exists())
+
+    def test_reserve_refuses_while_counter_missing(self):
+        caches["default"].delete(flash_sale._key(self.product.pk))
+
+        self.assertIsNone(flash_sale.reserve(self.product, 1))
+        self.assertEqual(flash_sale.available(self.product), 0)
+
+    def test_release_gives_stock_back(self):
+        reservation = flash_sale.reserve(self.product, 2)
+        flash_sale.release(reservation)
+
+        self.assertEqual(self.counter(), 5)
+        self.assertFalse(FlashSaleReservation.objects.exists())
+        self.assertEqual(self.quantity(), 5)
+
+    def test_release_after_flush_restores_quantity(self):
+        reservation = flash_sale.reserve(self.product, 2)
+        flash_sale.flush()
+        flash_sale.release(reservation)
+
+        self.assertEqual(self.counter(), 5)
+        self.assertEqual(self.quantity(), 5)
+
+
+class FlushTests(FlashSaleTestCase):
+    def test_flush_applies_logged_sales(self):
+        flash_sale.reserve(self.product, 2)
+        flash_sale.reserve(self.product, 1)
+
+        self.assertEqual(flash_sale.flush(), 1)
+        self.assertEqual(self.quantity(), 2)
+        self.assertEqual(self.counter(), 2)
+        self.assertFalse(FlashSaleReservation.objects.exists())
+
+    def test_lost_counter_is_rebuilt_without_reselling(self):
+        flash_sale.reserve(self.product, 2)
+        caches["default"].clear()
+
+        flash_sale.seed(self.product)
+        self.assertEqual(self.counter(), 3)
+
+        caches["default"].clear()
+        flash_sale.flush()
+        self.assertEqual(self.counter(), 3)
+        self.assertEqual(self.quantity(), 3)
+
+    def test_stale_counter_is_dropped_not_written_back(self):
+        flash_sale.flush()
+        Product.objects.filter(pk=self.product.pk).update(flash_sale=False)
+        caches["default"].set(flash_sale._key(self.product.pk), 0)
+
+        flash_sale.flush()
+
+        self.assertIsNone(self.counter())
+        self.assertEqual(self.quantity(), 5)
+
+    def test_seed_refuses_unflagged_product(self):
+        Product.objects.filter(pk=self.product.pk).update(flash_sale=False)
+        caches["default"].clear()
+
+        flash_sale.seed(self.product)
+
+        self.assertIsNone(self.counter())
+
+
+class CacheBackendTests(FlashSaleTestCase):
+    def test_only_redis_counts_as_shared(self):
+        self.assertFalse(cache_is_shared())
+        with tempfile.TemporaryDirectory() as location:
+            file_cache = {"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": location}}
+            with override_settings(CACHES=file_cache):
+                self.assertFalse(cache_is_shared())
+                with self.assertRaises(ImproperlyConfigured):
+                    flash_sale._take(flash_sale._key(self.product.pk), 1)
+
+    def test_cache_outage_reads_as_sold_out(self):
+        with mock.patch.object(caches["default"], "get_many", side_effect=ConnectionError), \
+                mock.patch.object(caches["default"], "get", side_effect=ConnectionError):
+            products = flash_sale.live_stock([Product.objects.get(pk=self.product.pk)])
+            self.assertEqual(products[0].quantity, 0)
+            self.assertEqual(flash_sale.available(self.product), 0)
+
+
+class ProductAdminTests(FlashSaleTestCase):
+    def save(self, obj, *changed):
+        admin = ProductAdmin(Product, AdminSite())
+        admin.save_model(None, obj, SimpleNamespace(changed_data=list(changed)), True)
+
+    def test_unflag_applies_sales_and_drops_counter(self):
+        flash_sale.reserve(self.product, 2)
+        obj = Product.objects.get(pk=self.product.pk)
+        obj.flash_sale = False
+
+        self.save(obj, "flash_sale")
+
+        self.assertIsNone(self.counter())
+        self.assertEqual(self.quantity(), 3)
+        self.assertFalse(Product.objects.get(pk=self.product.pk).flash_sale)
+        self.assertFalse(FlashSaleReservation.objects.exists())
+
+    def test_restock_rebuilds_counter_minus_pending_sales(self):
+        flash_sale.reserve(self.product, 2)
+        obj = Product.objects.get(pk=self.product.pk)
+        obj.quantity = 10
+
+        self.save(obj, "quantity")
+
+        self.assertEqual(self.counter(), 8)
+
+    def test_unedited_quantity_keeps_database_value(self):
+        obj = Product.objects.get(pk=self.product.pk)
+        Product.objects.filter(pk=self.product.pk).update(quantity=3)
+        obj.price = 12
+
+        self.save(obj, "price")
+
+        self.assertEqual(self.quantity(), 3)
+
+
+@mock.patch("store.views.render_to_string", return_value="")
+@mock.patch("store.views.weasyprint.HTML")
+class CheckoutTests(FlashSaleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.regular = Product.objects.create(category=self.category, name="Chain", price=5, quantity=4)
+        session = self.client.session
+        session["cart"] = {str(self.product.pk): 2, str(self.regular.pk): 1}
+        session.save()
+
+    def checkout(self):
+        return self.client.post(reverse("checkout"), {"name": "Rayan", "region": "tripoli"})
+
+    @mock.patch("store.views.resend.Emails.send")
+    def test_checkout_takes_stock(self, send, html, render):
+        response = self.checkout()
+
+        self.assertRedirects(response, reverse("order_success"), fetch_redirect_response=False)
+        self.assertEqual(self.counter(), 3)
+        self.assertEqual(FlashSaleReservation.objects.get().quantity, 2)
+        self.assertEqual(Product.objects.get(pk=self.regular.pk).quantity, 3)
+
+    @mock.patch("store.views.resend.Emails.send", side_effect=Exception("resend down"))
+    def test_failed_email_returns_held_stock(self, send, html, render):
+        response = self.checkout()
+
+        self.assertRedirects(response, reverse("home"), fetch_redirect_response=False)
+        self.assertEqual(self.counter(), 5)
+        self.assertFalse(FlashSaleReservation.objects.exists())
+        self.assertEqual(Product.objects.get(pk=self.regular.pk).quantity, 4)
+
+    def test_sold_out_item_returns_stock_already_held(self, html, render):
+        take_stock = flash_sale.take_stock
+
+        def regular_sells_out(product, qty):
+            # Sold out between the stock check and taking the stock
+            if product.pk == self.regular.pk:
+                return None
+            return take_stock(product, qty)
+
+        with mock.patch("store.views.flash_sale.take_stock", side_effect=regular_sells_out):
+            response = self.checkout()
+
+        self.assertRedirects(response, reverse("cart_view"), fetch_redirect_response=False)
+        self.assertEqual(self.counter(), 5)
+        self.assertFalse(FlashSaleReservation.objects.exists())
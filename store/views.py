@@ -11,6 +11,7 @@ import weasyprint  # Required for PDF generation
 
 from .models import Product, Category, Review
 from .forms import ReviewForm
+from . import flash_sale
 
 
 def checkout(request):
@@ -23,7 +24,7 @@ def checkout(request):
     items_summary = []  # List for the Invoice HTML
     items_text = ""     # String for the Email Body
     
-    products = Product.objects.filter(pk__in=cart.keys())
+    products = flash_sale.live_stock(Product.objects.filter(pk__in=cart.keys()))
 
     # Validate Stock
     for product in products:
@@ -121,6 +122,20 @@ Best regards,
 Rayan Sparkles Team
 """.strip()
 
+        # Take the stock before confirming, so two orders can't buy the same item
+        holds = []
+        for product in products:
+            qty = cart.get(str(product.pk), 0)
+            if qty <= 0:
+                continue
+            hold = flash_sale.take_stock(product, qty)
+            if hold is None:
+                for held in holds:
+                    flash_sale.return_stock(held)
+                messages.error(request, f"Sorry, '{product.name}' just sold out. Please update your cart.")
+                return redirect('cart_view')
+            holds.append(hold)
+
         try:
             # Send Email with Attachment
             resend.api_key = settings.RESEND_API_KEY
@@ -138,13 +153,6 @@ Rayan Sparkles Team
                 ]
             })
 
-            # Reduce Stock
-            for product in products:
-                qty_sold = cart.get(str(product.pk), 0)
-                if product.quantity >= qty_sold:
-                    product.quantity -= qty_sold
-                    product.save()
-
             # --- SAVE DATA FOR SUCCESS PAGE ---
             # We save the exact same context to session so we can show it on the next page
             request.session['invoice_data'] = invoice_context
@@ -160,6 +168,8 @@ Rayan Sparkles Team
             print("Exception:", repr(e))
             traceback.print_exc()
             print("==========================")
+            for held in holds:
+                flash_sale.return_stock(held)
             messages.error(request, "Order processed, but email failed to send. Please contact support.")
             # Even if email fails, we might still want to show success if stock was reduced
             # For now, let's redirect back to home or handle gracefully
@@ -185,18 +195,19 @@ def order_success(request):
 
 
 def home(request):
-    products = Product.objects.all()
+    products = flash_sale.live_stock(Product.objects.all())
     return render(request, "store/home.html", {"products": products})
 
 
 def product_detail(request, pk):
     product = get_object_or_404(Product, pk=pk)
+    flash_sale.live_stock([product])
     return render(request, "store/product_detail.html", {"product": product})
 
 
 def category_list(request, slug):
     category = get_object_or_404(Category, slug=slug)
-    products = Product.objects.filter(category=category, is_available=True)
+    products = flash_sale.live_stock(Product.objects.filter(category=category, is_available=True))
     return render(request, "store/category_list.html", {"category": category, "products": products})
 
 
@@ -208,7 +219,7 @@ def add_to_cart(request, pk):
     current_qty = cart.get(str_pk, 0)
 
     # Check if adding 1 more exceeds stock
-    if current_qty + 1 > product.quantity:
+    if current_qty + 1 > flash_sale.available(product):
         messages.error(request, "Sorry, we don't have enough stock!")
         return redirect('product_detail', pk=pk)
 